@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+------------------------------------------------------------
+Script: align_srt.py
+Purpose:
+    Automatically fix subtitle timing against the talk video
+    (instead of guessing offsets for shift_srt.py by hand).
+
+    1. Decode the mp4 (downloaded by download_sessions.py) with ffmpeg
+       into 8 kHz mono audio and reduce it to a 10 ms energy envelope.
+    2. Detect speech with a vectorized NumPy voice-activity detector.
+    3. Estimate the offset between subtitles and speech and the drift
+       (offset change over time): cross-correlate short segments over a
+       wide range and take the line most segments agree on, then refine
+       it with a narrow search around that line. Unreliable estimates are
+       rejected (see Notes).
+    4. Apply offset + drift, then snap each cue's start / end to the
+       nearest detected speech boundary.
+
+Usage:
+    1️⃣ Align the Japanese and Chinese subtitles of a talk (overwrites them):
+        python script/align_srt.py "talk/talk.mp4" "talk/talk.jp.srt" "talk/talk.zh.srt"
+
+    2️⃣ Only print the estimated offset / drift, do not write anything:
+        python script/align_srt.py --report "talk/talk.mp4" "talk/talk.jp.srt"
+
+    Notes:
+        - Offset and drift are estimated from the first .srt file and
+          applied to all given files, so translations stay in sync.
+        - Needs ffmpeg on PATH. Runs on CPU only; a 40-minute talk takes
+          a few seconds, most of it in ffmpeg decoding.
+        - Output is written in the same layout as fix_srt_overlap.py.
+        - The estimate needs pauses between cues to lock onto. Files whose
+          cues are back to back (most .jp.srt files here cover 93–100 %
+          of the talk) cannot be aligned this way. When too few segments
+          are usable, they disagree, the correlation is weak, or the result
+          would move cues outside the audio, the script exits with status 1
+          without writing anything (also with --report).
+------------------------------------------------------------
+"""
+
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+
+
+# === 自動安裝缺少的套件 ===
+def ensure_package(package_name):
+    try:
+        __import__(package_name)
+    except ImportError:
+        print(f"📦 偵測到未安裝套件 '{package_name}'，正在自動安裝中...")
+        try:
+            subprocess.check_call([
+                sys.executable, "-m", "pip", "install",
+                package_name, "--break-system-packages"
+            ])
+            print(f"✅ 已成功安裝 {package_name}")
+        except subprocess.CalledProcessError as e:
+            print(f"❌ 安裝 {package_name} 失敗：{e}")
+            sys.exit(1)
+
+
+ensure_package("numpy")
+
+import numpy as np
+
+SAMPLE_RATE = 8000          # Hz, plenty for speech energy
+FRAME_SEC = 0.01            # envelope resolution (10 ms)
+HOP = int(SAMPLE_RATE * FRAME_SEC)
+
+MAX_OFFSET_SEC = 120.0      # offset search range (±), pass 1
+COARSE_SEGMENT_SEC = 60.0   # pass 1 segment length (short, so drift barely smears a segment)
+SEGMENT_SEC = 300.0         # pass 2 segment length
+LOCAL_SEARCH_SEC = 1.0      # pass 2 search range (±) around the coarse line
+MIN_SEGMENT_SCORE = 0.2     # ignore segments whose correlation peak is weaker than this
+MAX_SEGMENT_COVERAGE = 0.9  # ignore segments (almost) fully covered by cues: no gaps to lock onto
+MAX_DRIFT = 0.01            # largest drift that is reliably recovered: 1 % (36 s per hour)
+DRIFT_MARGIN = 1.1          # accept fits slightly above MAX_DRIFT (estimation noise at the limit)
+
+# Confidence gate: if any of these fails, nothing is written
+MIN_SEGMENTS = 3            # pass 1 segments that must agree with the fitted line
+INLIER_SEC = 1.0            # a pass 1 segment agrees if its offset is this close to the line
+MIN_REFINE_SEGMENTS = 2     # usable pass 2 segments
+REFINE_TOLERANCE_SEC = 0.3  # every pass 2 segment must be this close to the refined line
+MIN_SCORE = 0.5             # median pass 2 correlation
+EDGE_SEC = 1.0              # cues may end up at most this far outside the audio
+
+SNAP_SEC = 0.3              # max distance a cue boundary moves to reach speech
+MIN_CUE_SEC = 0.2           # never shrink a cue below this length
+GAP_FILL_SEC = 0.25         # speech pauses shorter than this are treated as speech
+MIN_SPEECH_SEC = 0.1        # speech bursts shorter than this are treated as noise
+
+TIME_PATTERN = re.compile(r"(\d{2}):(\d{2}):(\d{2}),(\d{3})")
+
+
+# === 字幕讀寫 ===
+
+def read_entries(srt_path):
+    """Split an .srt file into blocks (list of lines), like fix_srt_overlap.py."""
+    with open(srt_path, "r", encoding="utf-8-sig") as f:
+        lines = f.read().splitlines()
+
+    entries, entry = [], []
+    for line in lines:
+        if line.strip() == "":
+            if entry:
+                entries.append(entry)
+                entry = []
+        else:
+            entry.append(line)
+    if entry:
+        entries.append(entry)
+    return entries
+
+
+def cue_times(entries):
+    """Return (starts, ends) arrays in seconds from the timing line of every block."""
+    starts, ends = [], []
+    for entry in entries:
+        found = TIME_PATTERN.findall(entry[1]) if len(entry) > 1 else []
+        if len(found) != 2:
+            raise ValueError(f"字幕 #{entry[0]} 的時間軸格式錯誤：{entry[1:2]}")
+        (h1, m1, s1, ms1), (h2, m2, s2, ms2) = found
+        starts.append(int(h1) * 3600 + int(m1) * 60 + int(s1) + int(ms1) / 1000)
+        ends.append(int(h2) * 3600 + int(m2) * 60 + int(s2) + int(ms2) / 1000)
+    return np.array(starts), np.array(ends)
+
+
+def format_time(seconds):
+    total_ms = int(round(max(seconds, 0.0) * 1000))
+    s, ms = divmod(total_ms, 1000)
+    m, s = divmod(s, 60)
+    h, m = divmod(m, 60)
+    return f"{h:02}:{m:02}:{s:02},{ms:03}"
+
+
+def write_entries(srt_path, entries, starts, ends):
+    for entry, start, end in zip(entries, starts, ends):
+        entry[1] = f"{format_time(start)} --> {format_time(end)}"
+    with open(srt_path, "w", encoding="utf-8") as f:
+        for e in entries:
+            f.write("\n".join(e) + "\n\n")
+
+
+# === 音訊 ===
+
+def decode_audio(video_path):
+    """Decode the audio track of a video to 8 kHz mono int16 samples with ffmpeg."""
+    result = subprocess.run(
+        [
+            "ffmpeg", "-nostdin", "-v", "error",
+            "-i", video_path,
+            "-vn", "-ac", "1", "-ar", str(SAMPLE_RATE),
+            "-f", "s16le", "-",
+        ],
+        capture_output=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode("utf-8", "replace").strip())
+    return np.frombuffer(result.stdout, dtype=np.int16)
+
+
+def energy_envelope(samples):
+    """Per-frame log energy (dB), one value every FRAME_SEC."""
+    x = samples.astype(np.float32)
+    # Pre-emphasis: damp low-frequency hum / music so speech dominates the energy
+    x[1:] -= 0.97 * x[:-1].copy()
+    n = len(x) // HOP
+    frames = x[: n * HOP].reshape(n, HOP)
+    frames = frames - frames.mean(axis=1, keepdims=True)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    return 20 * np.log10(rms + 1.0)
+
+
+def _run_length(mask, size, keep):
+    """Morphological filter: dilate (keep=False→any) / erode (keep=True→all) with a window of `size` frames."""
+    if size <= 1:
+        return mask
+    count = np.convolve(mask.astype(np.int32), np.ones(size, dtype=np.int32), mode="same")
+    return count == size if keep else count > 0
+
+
+def detect_speech(envelope):
+    """Boolean speech mask (one value per frame) from the energy envelope."""
+    smoothed = np.convolve(envelope, np.ones(5) / 5, mode="same")
+    floor, peak = np.percentile(smoothed, [10, 95])
+    mask = smoothed > floor + 0.4 * (peak - floor)
+
+    gap = int(GAP_FILL_SEC / FRAME_SEC) | 1
+    burst = int(MIN_SPEECH_SEC / FRAME_SEC) | 1
+    mask = _run_length(_run_length(mask, gap, keep=False), gap, keep=True)      # closing
+    mask = _run_length(_run_length(mask, burst, keep=True), burst, keep=False)  # opening
+    return mask
+
+
+def speech_boundaries(mask):
+    """Return (onsets, offsets) of speech regions, in seconds."""
+    d = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    onsets = np.flatnonzero(d == 1) * FRAME_SEC
+    offsets = np.flatnonzero(d == -1) * FRAME_SEC
+    return onsets, offsets
+
+
+# === 時間軸估計 ===
+
+def cue_mask(starts, ends, length):
+    """Frame mask that is 1 inside any cue, built with a cumulative sum (no per-frame loop)."""
+    marks = np.zeros(length + 1, dtype=np.int32)
+    s = np.clip((starts / FRAME_SEC).astype(int), 0, length)
+    e = np.clip((ends / FRAME_SEC).astype(int), 0, length)
+    np.add.at(marks, s, 1)
+    np.add.at(marks, e, -1)
+    return np.cumsum(marks[:-1]) > 0
+
+
+def _segment_offsets(speech, cues, seg_sec, search_sec):
+    """
+    Offset (seconds) of every segment of the cue mask against the speech mask.
+
+    Each segment is searched independently within ±search_sec, so one bad
+    segment cannot pull the others. Returns (times, offsets, scores) arrays;
+    times are segment centres in cue time. Segments with few cues or a weak
+    correlation peak are left out.
+    """
+    length = len(speech)
+    seg = int(seg_sec / FRAME_SEC)
+    search = int(search_sec / FRAME_SEC)
+    # Silence around the audio, so segments at either end get the full ±search range
+    padded = np.pad(speech, search).astype(np.float32)
+    times, offsets, scores = [], [], []
+    for begin in range(0, length, seg):
+        stop = min(begin + seg, length)
+        seg_cues = cues[begin:stop].astype(np.float32)
+        if not 0.2 <= seg_cues.mean() <= MAX_SEGMENT_COVERAGE:
+            continue
+        # padded[begin + search] is speech[begin]; the window covers lags -search … +search
+        window = padded[begin: stop + 2 * search].copy()
+        window -= window.mean()
+
+        # corr[k] = sum_t window[t + k] * seg_cues[t]; k = search + lag
+        n = 1 << int(np.ceil(np.log2(len(window) + len(seg_cues))))
+        corr = np.fft.irfft(np.fft.rfft(window, n) * np.conj(np.fft.rfft(seg_cues, n)), n)
+        k = int(np.argmax(corr[: 2 * search + 1]))
+
+        matched = padded[begin + k: begin + k + len(seg_cues)]
+        if matched.std() == 0 or seg_cues.std() == 0:
+            continue
+        score = float(np.corrcoef(matched, seg_cues)[0, 1])
+        if score < MIN_SEGMENT_SCORE:
+            continue
+        times.append((begin + stop) / 2 * FRAME_SEC)
+        offsets.append((k - search) * FRAME_SEC)
+        scores.append(score)
+    return np.array(times), np.array(offsets), np.array(scores)
+
+
+def _consensus_line(times, offsets):
+    """
+    Fit offset = a + b * t through the segments that agree with each other.
+
+    Every line through two segments (and every zero-drift line through one)
+    with a plausible drift is a candidate; the one that most segments lie
+    within INLIER_SEC of wins, and is refitted on those segments. Unlike a
+    median fit, this holds up when half of the segments locked onto the
+    wrong peak. Returns (offset, drift, inliers).
+    """
+    i, j = np.triu_indices(len(times), k=1)
+    slopes = np.concatenate([(offsets[j] - offsets[i]) / (times[j] - times[i]), np.zeros(len(times))])
+    intercepts = np.concatenate([offsets[i] - slopes[: len(i)] * times[i], offsets])
+    keep = np.abs(slopes) <= MAX_DRIFT * DRIFT_MARGIN
+    slopes, intercepts = slopes[keep], intercepts[keep]
+
+    residuals = np.abs(offsets[None, :] - (intercepts[:, None] + slopes[:, None] * times[None, :]))
+    close = residuals <= INLIER_SEC
+    counts = close.sum(axis=1)
+    # Most segments first, then the tightest fit among them
+    spread = np.where(close, residuals, 0).sum(axis=1)
+    best = np.lexsort((spread, -counts))[0]
+    inliers = close[best]
+
+    if len(np.unique(times[inliers])) >= 2:
+        drift, offset = np.polyfit(times[inliers], offsets[inliers], 1)
+        if abs(drift) <= MAX_DRIFT * DRIFT_MARGIN:
+            return float(offset), float(drift), inliers
+    return float(intercepts[best]), float(slopes[best]), inliers
+
+
+def estimate_timing(speech, starts, ends):
+    """
+    Estimate offset(t) = offset + drift * t (seconds) between subtitles and speech.
+
+    Two passes, so the search window always matches the drift that can occur:
+    1. Coarse: short segments, each searched over ±MAX_OFFSET_SEC, then the
+       line most of their offsets agree on (_consensus_line).
+    2. Refine: map the cues with the coarse line, search ±LOCAL_SEARCH_SEC
+       around it with longer segments, and fit the residual line.
+
+    Returns (offset, drift, score); score is the median segment correlation.
+    Raises ValueError if the estimate cannot be trusted (see the confidence
+    gate constants); callers must not write anything in that case.
+    """
+    audio_sec = len(speech) * FRAME_SEC
+    length = max(len(speech), int(ends.max() / FRAME_SEC) + 1)
+    speech = np.pad(speech, (0, length - len(speech)))
+
+    # --- Pass 1: coarse ---
+    times, offsets, scores = _segment_offsets(
+        speech, cue_mask(starts, ends, length), COARSE_SEGMENT_SEC, MAX_OFFSET_SEC
+    )
+    if len(times) < MIN_SEGMENTS:
+        raise ValueError(
+            f"只有 {len(times)} 段可用於估計（至少需要 {MIN_SEGMENTS} 段）；"
+            "字幕之間幾乎沒有空檔時無法用語音對齊"
+        )
+
+    offset, drift, agree = _consensus_line(times, offsets)
+    inliers = int(agree.sum())
+    if inliers < max(MIN_SEGMENTS, len(times) / 2):
+        raise ValueError(f"各段的偏移不一致（{inliers} / {len(times)} 段符合估計）")
+
+    # --- Pass 2: refine around the coarse line ---
+    mapped_starts = starts + offset + drift * starts
+    mapped_ends = ends + offset + drift * ends
+    times, residuals, scores = _segment_offsets(
+        speech, cue_mask(mapped_starts, mapped_ends, length), SEGMENT_SEC, LOCAL_SEARCH_SEC
+    )
+    if len(times) < MIN_REFINE_SEGMENTS:
+        raise ValueError(f"細調時只有 {len(times)} 段可用（至少需要 {MIN_REFINE_SEGMENTS} 段）")
+    score = float(np.median(scores))
+    if score < MIN_SCORE:
+        raise ValueError(f"相關係數 {score:.2f} 低於 {MIN_SCORE}")
+    r_drift, r_offset = np.polyfit(times, residuals, 1, w=scores)
+    # A peak at the edge of the ±LOCAL_SEARCH_SEC window, or a segment off the
+    # refined line, means the coarse line locked onto the wrong offset
+    at_edge = np.abs(residuals) >= LOCAL_SEARCH_SEC - FRAME_SEC
+    off_line = np.abs(residuals - (r_offset + r_drift * times)) > REFINE_TOLERANCE_SEC
+    if np.any(at_edge | off_line):
+        raise ValueError(f"細調時有 {int(np.sum(at_edge | off_line))} / {len(times)} 段與估計不一致")
+
+    # mapped = t * (1 + drift) + offset, final = mapped * (1 + r_drift) + r_offset
+    final_offset = offset * (1 + r_drift) + r_offset
+    final_drift = (1 + drift) * (1 + r_drift) - 1
+
+    # Plausibility: the offset must not sit at the edge of the search range,
+    # and the shifted cues must stay inside the audio
+    first = starts.min() * (1 + final_drift) + final_offset
+    last = ends.max() * (1 + final_drift) + final_offset
+    if abs(final_offset) > MAX_OFFSET_SEC - EDGE_SEC or first < -EDGE_SEC or last > audio_sec + EDGE_SEC:
+        raise ValueError(
+            f"估計結果不合理（偏移 {final_offset:+.2f}s，字幕會落在 {first:.1f}s～{last:.1f}s，"
+            f"音訊長 {audio_sec:.1f}s）"
+        )
+    return float(final_offset), float(final_drift), score
+
+
+def snap(times, boundaries):
+    """Move each time to the nearest boundary within SNAP_SEC (vectorized)."""
+    if len(boundaries) == 0:
+        return times.copy(), np.zeros(len(times), dtype=bool)
+    idx = np.searchsorted(boundaries, times)
+    left = boundaries[np.clip(idx - 1, 0, len(boundaries) - 1)]
+    right = boundaries[np.clip(idx, 0, len(boundaries) - 1)]
+    nearest = np.where(np.abs(times - left) <= np.abs(right - times), left, right)
+    snapped = np.abs(nearest - times) <= SNAP_SEC
+    return np.where(snapped, nearest, times), snapped
+
+
+def align_cues(starts, ends, offset, drift, onsets, offsets):
+    """Apply offset + drift, snap to speech boundaries, and keep cues ordered and non-overlapping."""
+    new_starts = starts + offset + drift * starts
+    new_ends = ends + offset + drift * ends
+
+    snapped_starts, s_ok = snap(new_starts, onsets)
+    snapped_ends, e_ok = snap(new_ends, offsets)
+    # Only accept a snap that keeps the cue long enough
+    valid = snapped_ends - snapped_starts >= MIN_CUE_SEC
+    new_starts = np.where(valid, snapped_starts, new_starts)
+    new_ends = np.where(valid, snapped_ends, new_ends)
+
+    new_starts = np.maximum(new_starts, 0.0)
+    new_ends = np.maximum(new_ends, new_starts + 0.001)
+    # Same rule as fix_srt_overlap.py: a cue starts 1 ms after the previous one ends
+    for i in range(1, len(new_starts)):
+        if new_starts[i] <= new_ends[i - 1]:
+            new_starts[i] = new_ends[i - 1] + 0.001
+            new_ends[i] = max(new_ends[i], new_starts[i] + 0.001)
+
+    return new_starts, new_ends, int(np.sum(valid & s_ok)), int(np.sum(valid & e_ok))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Align .srt timing to the speech in a talk video.")
+    parser.add_argument("video", help="talk video (.mp4)")
+    parser.add_argument("srt_files", nargs="+", help=".srt files to align; the first one is used for estimation")
+    parser.add_argument("--report", action="store_true", help="only print the estimate, do not write files")
+    args = parser.parse_args()
+
+    if shutil.which("ffmpeg") is None:
+        print("❌ 找不到 ffmpeg，請先安裝後再執行（brew install ffmpeg / apt install ffmpeg）。")
+        sys.exit(1)
+    for path in [args.video] + args.srt_files:
+        if not os.path.exists(path):
+            print(f"找不到檔案: {path}")
+            sys.exit(1)
+
+    # 先讀完所有字幕的時間軸，格式錯誤時在解碼音訊、寫檔之前就停下
+    parsed = []
+    for path in args.srt_files:
+        entries = read_entries(path)
+        if not entries:
+            print(f"⚠️ 空的字幕檔：{path}")
+            sys.exit(1)
+        try:
+            starts, ends = cue_times(entries)
+        except ValueError as e:
+            print(f"❌ {path}：{e}")
+            sys.exit(1)
+        parsed.append((path, entries, starts, ends))
+
+    t0 = time.time()
+    try:
+        samples = decode_audio(args.video)
+    except RuntimeError as e:
+        print(f"❌ 無法解碼音訊：{e}")
+        sys.exit(1)
+    t1 = time.time()
+
+    speech = detect_speech(energy_envelope(samples))
+    onsets, offsets = speech_boundaries(speech)
+
+    _, _, starts, ends = parsed[0]
+    try:
+        offset, drift, score = estimate_timing(speech, starts, ends)
+    except ValueError as e:
+        print(f"❌ 無法可靠地估計時間軸，未修改任何檔案：{e}")
+        sys.exit(1)
+    t2 = time.time()
+
+    print(f"🎧 解碼 {len(samples) / SAMPLE_RATE / 60:.1f} 分鐘音訊：{t1 - t0:.1f}s，分析：{t2 - t1:.1f}s")
+    print(f"🔍 偵測到 {len(onsets)} 段語音，相關係數 {score:.2f}")
+    print(f"⏱️ 估計偏移 {offset:+.3f}s，漂移 {drift * 60 * 1000:+.1f} ms/分鐘")
+
+    if args.report:
+        return
+
+    for path, entries, starts, ends in parsed:
+        new_starts, new_ends, n_start, n_end = align_cues(starts, ends, offset, drift, onsets, offsets)
+        write_entries(path, entries, new_starts, new_ends)
+        print(f"✅ {path}：{len(entries)} 條字幕，{n_start} 個開始 / {n_end} 個結束對齊到語音邊界")
+
+
+if __name__ == "__main__":
+    main()
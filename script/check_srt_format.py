@@ -3,6 +3,8 @@ import re
 import sys
 from datetime import timedelta
 
+from srt_diff import load_diff
+
 # Regex for SRT timestamp line
 TIME_PATTERN = re.compile(
     r"^(\d{2}):(\d{2}):(\d{2}),(\d{3}) --> (\d{2}):(\d{2}):(\d{2}),(\d{3})$"
@@ -13,8 +15,16 @@ def parse_timestamp(h, m, s, ms):
     return timedelta(hours=int(h), minutes=int(m), seconds=int(s), milliseconds=int(ms))
 
 
-def check_srt_format(file_path):
-    """Validate .srt file structure and timing order."""
+def check_srt_format(file_path, ranges=None):
+    """
+    Validate .srt file structure and timing order.
+
+    If ranges (0-based [start, end) cue ranges from srt_diff.py) is given,
+    the structure of every block (line count, index, timestamp format, text)
+    is still checked, but the timing order (end after start, no overlap) is
+    only checked inside those ranges. The block just before each range is
+    used for the overlap check.
+    """
     try:
         with open(file_path, "r", encoding="utf-8-sig") as f:
             lines = [line.rstrip("\n") for line in f.readlines()]
@@ -37,10 +47,16 @@ def check_srt_format(file_path):
     if current_block:
         blocks.append((current_block, line_numbers))
 
-    expected_index = 1
     prev_end_time = timedelta(0)
     prev_block_info = None  # (block_index, end_time, line_number)
 
+    if ranges is None:
+        ranges = [(0, len(blocks))]
+    check_timing = [False] * len(blocks)
+    for range_start, range_end in ranges:
+        for i in range(max(range_start, 0), min(range_end, len(blocks))):
+            check_timing[i] = True
+
     for block_index, (block_lines, block_line_nums) in enumerate(blocks, start=1):
         if len(block_lines) < 3:
             return False, f"Block {block_index}: too few lines (needs at least 3), starts at line {block_line_nums[0]}"
@@ -50,6 +66,7 @@ def check_srt_format(file_path):
         if not idx_line.isdigit():
             return False, f"Block {block_index}: line {block_line_nums[0]} should be a numeric index, found '{idx_line}'"
         index = int(idx_line)
+        expected_index = block_index
         if index != expected_index:
             hint = ""
             if index > expected_index:
@@ -57,7 +74,6 @@ def check_srt_format(file_path):
             elif index < expected_index:
                 hint = " (duplicate or misplaced index)"
             return False, f"Block {block_index}: line {block_line_nums[0]} index mismatch (expected {expected_index}, got {index}){hint}"
-        expected_index += 1
 
         # --- Check timestamp line ---
         time_line = block_lines[1].strip()
@@ -68,22 +84,14 @@ def check_srt_format(file_path):
                 f"(expected 'HH:MM:SS,mmm --> HH:MM:SS,mmm'), got '{time_line}'"
             )
 
-        start = parse_timestamp(*m.groups()[:4])
-        end = parse_timestamp(*m.groups()[4:])
-
-        if end <= start:
-            return False, f"Block {block_index}: line {block_line_nums[1]} end time is earlier than or equal to start time"
-
-        # --- Check against previous block ---
-        if prev_block_info:
-            prev_idx, prev_end, prev_line = prev_block_info
-            if start < prev_end:
-                return False, (
-                    f"Block {block_index}: line {block_line_nums[1]} start time overlaps "
-                    f"with previous block {prev_idx} (previous end at line {prev_line})"
-                )
-
-        prev_block_info = (block_index, end, block_line_nums[1])
+        if check_timing[block_index - 1]:
+            # First block of a diff range: take the preceding (unchecked) block's end time
+            if block_index > 1 and (prev_block_info is None or prev_block_info[0] != block_index - 1):
+                prev_block_info = _block_end_info(block_index - 1, *blocks[block_index - 2])
+            error = _check_timing(block_index, block_line_nums, m, prev_block_info)
+            if error:
+                return False, error
+            prev_block_info = (block_index, parse_timestamp(*m.groups()[4:]), block_line_nums[1])
 
         # --- Check subtitle text presence ---
         if not any(l.strip() for l in block_lines[2:]):
@@ -92,6 +100,35 @@ def check_srt_format(file_path):
     return True, "OK"
 
 
+def _check_timing(block_index, block_line_nums, m, prev_block_info):
+    """Return an error message if the block's times are out of order, else None."""
+    start = parse_timestamp(*m.groups()[:4])
+    end = parse_timestamp(*m.groups()[4:])
+
+    if end <= start:
+        return f"Block {block_index}: line {block_line_nums[1]} end time is earlier than or equal to start time"
+
+    # --- Check against previous block ---
+    if prev_block_info:
+        prev_idx, prev_end, prev_line = prev_block_info
+        if start < prev_end:
+            return (
+                f"Block {block_index}: line {block_line_nums[1]} start time overlaps "
+                f"with previous block {prev_idx} (previous end at line {prev_line})"
+            )
+    return None
+
+
+def _block_end_info(block_index, block_lines, block_line_nums):
+    """Return (block_index, end_time, line_number) for a block, or None if its timestamp is invalid."""
+    if len(block_lines) < 2:
+        return None
+    m = TIME_PATTERN.match(block_lines[1].strip())
+    if not m:
+        return None
+    return (block_index, parse_timestamp(*m.groups()[4:]), block_line_nums[1])
+
+
 def main():
     changed_files = os.getenv("CHANGED_FILES", "").splitlines()
 
@@ -108,11 +145,15 @@ def main():
         print("No .srt files found.")
         sys.exit(0)
 
+    # Optional cue-level diff from srt_diff.py: only check the changed ranges
+    diff_file = os.getenv("SRT_DIFF_FILE", "")
+
     failed = []
     for path in srt_files:
         if not os.path.exists(path):
             continue
-        ok, msg = check_srt_format(path)
+        diff = load_diff(diff_file, path)
+        ok, msg = check_srt_format(path, diff["ranges"] if diff else None)
         if ok:
             print(f"✅ {path}")
         else:
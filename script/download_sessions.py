@@ -1,5 +1,6 @@
 # 在 iosdc2025translate/script/ 資料夾中執行：
 # python3 download_sessions.py
+# 只下載單一場次：python3 download_sessions.py <資料夾名稱>
 # 影片就會自動下載到與 session.txt 同層的各個對應資料夾中。
 
 # 範例檔案結構
@@ -18,57 +19,30 @@ import os
 import sys
 import shutil
 
-# === 檢查環境 ===
-current_dir = os.getcwd()
-parent_dir = os.path.dirname(current_dir)
-session_file = os.path.join(parent_dir, "session.txt")
-
-# 檢查是否在 script 資料夾
-if os.path.basename(current_dir) != "script":
-    print("⚠️ 請在 'script' 資料夾內執行此腳本。")
-    print(f"目前位置：{current_dir}")
-    sys.exit(1)
-
-# 檢查上一層是否有 session.txt
-if not os.path.exists(session_file):
-    print("❌ 找不到 session.txt，請確認它存在於上一層。")
-    print(f"預期位置：{session_file}")
-    sys.exit(1)
-
-# 檢查是否安裝 yt-dlp
-if shutil.which("yt-dlp") is None:
-    print("❌ 找不到 yt-dlp，請先安裝後再執行。")
-    print("\n安裝方式：")
-    print("macOS / Linux:")
-    print("  brew install yt-dlp    或    pip install yt-dlp")
-    print("\nWindows:")
-    print("  pip install yt-dlp")
-    sys.exit(1)
-
-print("✅ 檢查通過，開始下載...\n")
-
-# === 讀取 session.txt ===
-with open(session_file, "r", encoding="utf-8") as f:
-    lines = [line.strip() for line in f if line.strip()]
-
-# === 每兩行一組：資料夾名稱 + URL ===
-for i in range(0, len(lines), 2):
-    folder_name = lines[i]
-    url = lines[i + 1] if i + 1 < len(lines) else None
-
-    if not url or not url.startswith("http"):
-        print(f"⚠️ 跳過：{folder_name}（URL 無效）")
-        continue
 
+def read_sessions(session_file):
+    """讀取 session.txt，每兩行一組：資料夾名稱 + URL。回傳 [(folder_name, url), ...]"""
+    with open(session_file, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip()]
+
+    sessions = []
+    for i in range(0, len(lines), 2):
+        folder_name = lines[i]
+        url = lines[i + 1] if i + 1 < len(lines) else None
+        sessions.append((folder_name, url))
+    return sessions
+
+
+def download_session(parent_dir, folder_name, url):
+    """下載單一場次影片到 parent_dir/folder_name/，回傳 yt-dlp 的結束碼。"""
     # 對應資料夾（在上一層）
     folder_path = os.path.join(parent_dir, folder_name)
     if not os.path.isdir(folder_path):
         print(f"📁 建立資料夾：{folder_name}")
         os.makedirs(folder_path, exist_ok=True)
 
-    # 安全檔名
-    safe_name = "".join(c for c in folder_name if c not in r'\/:*?"<>|').strip()
-    output_mp4 = os.path.join(folder_path, f"{safe_name}.mp4")
+    output_mp4 = video_path(parent_dir, folder_name)
+    safe_name = os.path.splitext(os.path.basename(output_mp4))[0]
 
     # 若已存在，先刪除舊檔
     if os.path.exists(output_mp4):
@@ -79,7 +53,7 @@ for i in range(0, len(lines), 2):
     output_template = os.path.join(folder_path, f"{safe_name}.%(ext)s")
 
     print(f"🎬 下載：{folder_name}")
-    subprocess.run([
+    result = subprocess.run([
         "yt-dlp",
         "-f", "bestvideo+bestaudio/best",
         "--merge-output-format", "mp4",
@@ -89,9 +63,72 @@ for i in range(0, len(lines), 2):
         "--no-warnings",  
         url
     ], check=False)
-
-print("\n✅ 全部影片下載完成")
-
-
+    return result.returncode
 
 
+def video_path(parent_dir, folder_name):
+    """場次影片的路徑：parent_dir/folder_name/<安全檔名>.mp4"""
+    safe_name = "".join(c for c in folder_name if c not in r'\/:*?"<>|').strip()
+    return os.path.join(parent_dir, folder_name, f"{safe_name}.mp4")
+
+
+def main():
+    # === 檢查環境 ===
+    current_dir = os.getcwd()
+    parent_dir = os.path.dirname(current_dir)
+    session_file = os.path.join(parent_dir, "session.txt")
+
+    # 檢查是否在 script 資料夾
+    if os.path.basename(current_dir) != "script":
+        print("⚠️ 請在 'script' 資料夾內執行此腳本。")
+        print(f"目前位置：{current_dir}")
+        sys.exit(1)
+
+    # 檢查上一層是否有 session.txt
+    if not os.path.exists(session_file):
+        print("❌ 找不到 session.txt，請確認它存在於上一層。")
+        print(f"預期位置：{session_file}")
+        sys.exit(1)
+
+    # 檢查是否安裝 yt-dlp
+    if shutil.which("yt-dlp") is None:
+        print("❌ 找不到 yt-dlp，請先安裝後再執行。")
+        print("\n安裝方式：")
+        print("macOS / Linux:")
+        print("  brew install yt-dlp    或    pip install yt-dlp")
+        print("\nWindows:")
+        print("  pip install yt-dlp")
+        sys.exit(1)
+
+    print("✅ 檢查通過，開始下載...\n")
+
+    # === 讀取 session.txt ===
+    sessions = read_sessions(session_file)
+
+    # 指定資料夾名稱時只下載該場次
+    only = sys.argv[1] if len(sys.argv) > 1 else None
+    if only:
+        sessions = [s for s in sessions if s[0] == only]
+        if not sessions:
+            print(f"❌ session.txt 中找不到：{only}")
+            sys.exit(1)
+
+    failed = []
+    for folder_name, url in sessions:
+        if not url or not url.startswith("http"):
+            print(f"⚠️ 跳過：{folder_name}（URL 無效）")
+            continue
+        if download_session(parent_dir, folder_name, url) != 0:
+            failed.append(folder_name)
+
+    if failed:
+        print(f"\n❌ {len(failed)} 部影片下載失敗：")
+        for folder_name in failed:
+            print(f"   - {folder_name}")
+        sys.exit(1)
+
+    print("\n✅ 全部影片下載完成")
+
+
+if __name__ == "__main__":
+    main()
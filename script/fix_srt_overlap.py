@@ -1,6 +1,8 @@
 import re
 from datetime import timedelta
 
+from srt_diff import load_diff
+
 def parse_time(time_str):
     h, m, s_ms = time_str.split(':')
     s, ms = s_ms.split(',')
@@ -14,7 +16,8 @@ def format_time(td):
     s = total_seconds % 60
     return f"{h:02}:{m:02}:{s:02},{ms:03}"
 
-def fix_overlaps(srt_path):
+def fix_overlaps(srt_path, ranges=None):
+    # ranges: 0-based [start, end) cue ranges from srt_diff.py; None = check every cue
     with open(srt_path, 'r', encoding='utf-8') as f:
         lines = f.read().splitlines()
 
@@ -32,7 +35,10 @@ def fix_overlaps(srt_path):
 
     changes = []
 
-    for i in range(1, len(entries)):
+    if ranges is None:
+        ranges = [(0, len(entries))]
+
+    for i in (i for start, end in ranges for i in range(max(start, 1), min(end, len(entries)))):
         prev_time = entries[i - 1][1]
         curr_time = entries[i][1]
 
@@ -66,8 +72,9 @@ def fix_overlaps(srt_path):
 
 if __name__ == "__main__":
     import sys
-    if len(sys.argv) != 2:
-        print("用法: python fix_srt_overlap.py <字幕檔.srt>")
+    if len(sys.argv) not in (2, 3):
+        print("用法: python fix_srt_overlap.py <字幕檔.srt> [srt_diff.json]")
     else:
-        fix_overlaps(sys.argv[1])
+        diff = load_diff(sys.argv[2], sys.argv[1]) if len(sys.argv) == 3 else None
+        fix_overlaps(sys.argv[1], diff["ranges"] if diff else None)
         print(f"\n✅ 已修正重疊時間並覆蓋檔案: {sys.argv[1]}")
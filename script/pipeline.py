@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+------------------------------------------------------------
+Script: pipeline.py
+Purpose:
+    Run the download → translate → fix → align → validate pipeline for every
+    talk, redoing only the stages whose inputs changed since the last run.
+
+    Per-talk stage state and input hashes are kept in
+    pipeline_manifest.json (repo root), built from session.txt plus any
+    talk folder that already contains a .jp.srt / .ja.srt.
+
+Usage:
+    1️⃣ Run everything that is stale:
+        python script/pipeline.py
+
+    2️⃣ Show what would run, without running it:
+        python script/pipeline.py --dry-run
+
+    3️⃣ Only some talks, more workers, custom per-stage limits:
+        python script/pipeline.py --talk "カスタムUIを作る覚悟" -j 8 --limit translate=4
+
+    4️⃣ Show the manifest:
+        python script/pipeline.py --status
+
+    5️⃣ Mark the current files as up to date without running anything
+       (e.g. translations that already exist in the repo):
+        python script/pipeline.py --touch --talk "カスタムUIを作る覚悟"
+
+    6️⃣ Also align subtitle timing to the video (off by default):
+        python script/pipeline.py --align --talk "カスタムUIを作る覚悟"
+
+    Notes:
+        - A stage is stale when its input hash differs from the one
+          recorded after its last successful run, when one of its outputs
+          is missing, or when it failed last time.
+        - Input hashes are recorded *after* a stage runs, so stages that
+          edit their input in place (fix) do not trigger themselves again.
+        - Stages run in a shared worker pool (-j). download, translate and
+          align are additionally capped (network / API quota / ffmpeg CPU),
+          see DEFAULT_LIMITS.
+        - If a stage fails, the later stages of that talk are skipped.
+        - download / translate with no manifest record but existing outputs
+          (e.g. a fresh clone) are recorded as up to date instead of re-run,
+          so the reviewed .zh.srt files and the videos are kept. --force
+          overrides this.
+        - translate only hashes the cue *text* of the source, so retiming
+          (align, shift_srt.py) does not trigger a new translation.
+        - align only runs with --align: it rewrites the timing of reviewed
+          subtitles, and align_srt.py refuses (the stage fails) when the
+          estimate is unreliable, e.g. for back-to-back cues.
+        - align rewrites the timing of the .zh.srt, so after a successful
+          align the fix record is re-hashed; otherwise fix (and validate
+          after it) would be stale on every run.
+        - After each translate run the source is snapshotted in
+          .pipeline_cache/. The next run diffs against it (srt_diff.py) and
+          only translates changed cues, keeping hand corrections elsewhere.
+          If the diff cannot be applied to the existing .zh.srt (or there is
+          no snapshot), the stage fails and the file is left alone.
+          --force re-translates the whole file instead, e.g. after a prompt
+          change (this overwrites hand corrections).
+------------------------------------------------------------
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from check_srt_format import check_srt_format
+from download_sessions import read_sessions, video_path
+from srt_diff import diff_files, parse_cues
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SCRIPT_DIR)
+SESSION_FILE = os.path.join(ROOT_DIR, "session.txt")
+MANIFEST_FILE = os.path.join(ROOT_DIR, "pipeline_manifest.json")
+# Source .srt as of the last translate run, used to translate only changed cues
+SNAPSHOT_DIR = os.path.join(ROOT_DIR, ".pipeline_cache")
+
+# Files larger than this are fingerprinted by size + mtime instead of content (videos)
+HASH_CONTENT_LIMIT = 16 * 1024 * 1024
+
+# Stages that are expensive or overwrite reviewed files. With no manifest record
+# (fresh clone, new manifest) and all their outputs present, they are recorded
+# as up to date instead of being run. Use --force to redo them anyway.
+ADOPT_EXISTING = {"download", "translate"}
+
+# Stages that rewrite reviewed subtitles and only run when asked for (--align).
+# align_srt.py refuses unreliable estimates, but most talks here have back-to-back
+# cues it cannot align, so it should be run on purpose and its result reviewed.
+OPT_IN = {"align"}
+
+# Max concurrent tasks per stage (stages not listed are only limited by --jobs)
+DEFAULT_LIMITS = {"download": 2, "translate": 2, "align": 2}
+
+Talk = namedtuple("Talk", ["name", "url", "folder"])
+
+# inputs(talk) -> list of ("url", str) / ("file", path) / ("srt-text", path),
+#                 or None if the stage does not apply
+# outputs(talk) -> list of paths that must exist for the stage to count as up to date
+# run(talk, force) -> (ok, log); force is the --force flag
+Stage = namedtuple("Stage", ["name", "deps", "inputs", "outputs", "run"])
+
+
+# === Talks ===
+
+def load_talks():
+    """Talks from session.txt, plus talk folders that have subtitles but no session entry."""
+    talks = []
+    if os.path.exists(SESSION_FILE):
+        for name, url in read_sessions(SESSION_FILE):
+            if not url or not url.startswith("http"):
+                url = None
+            talks.append(Talk(name, url, os.path.join(ROOT_DIR, name)))
+
+    known = {t.name for t in talks}
+    for entry in sorted(os.listdir(ROOT_DIR)):
+        folder = os.path.join(ROOT_DIR, entry)
+        if entry not in known and os.path.isdir(folder) and _find_source_srt(folder):
+            talks.append(Talk(entry, None, folder))
+    return talks
+
+
+def _find_source_srt(folder):
+    for pattern in ("*.jp.srt", "*.ja.srt"):
+        found = sorted(glob.glob(os.path.join(glob.escape(folder), pattern)))
+        if found:
+            return found[0]
+    return None
+
+
+def source_srt(talk):
+    """The Japanese subtitle file of a talk, or None."""
+    return _find_source_srt(talk.folder)
+
+
+def target_srt(talk):
+    """The Chinese subtitle file translate_srt.py writes for this talk, or None."""
+    src = source_srt(talk)
+    if not src:
+        return None
+    return src[:-len(".jp.srt")] + ".zh.srt"
+
+
+# === Stages ===
+
+def _run_script(*args, cwd=ROOT_DIR):
+    result = subprocess.run(
+        [sys.executable, *args], cwd=cwd, capture_output=True, text=True,
+    )
+    return result.returncode == 0, (result.stdout + result.stderr).strip()
+
+
+def _download_inputs(talk):
+    return [("url", talk.url)] if talk.url else None
+
+
+def _download_run(talk, force):
+    # download_sessions.py must be run from inside script/
+    return _run_script("download_sessions.py", talk.name, cwd=SCRIPT_DIR)
+
+
+def _translate_inputs(talk):
+    # Only the cue text matters. translate_srt.py itself is not an input:
+    # editing it must not re-buy every translation (use --force for that).
+    src = source_srt(talk)
+    if not src:
+        return None
+    return [("srt-text", src)]
+
+
+def _snapshot_path(talk):
+    return os.path.join(SNAPSHOT_DIR, f"{talk.name}.jp.srt")
+
+
+def _save_snapshot(talk):
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    shutil.copyfile(source_srt(talk), _snapshot_path(talk))
+
+
+def _translate_run(talk, force):
+    src, target, snapshot = source_srt(talk), target_srt(talk), _snapshot_path(talk)
+    args = [os.path.join(SCRIPT_DIR, "translate_srt.py"), src]
+
+    # An existing .zh.srt may carry hand corrections: only update it cue by cue.
+    # If that is not possible, fail instead of re-translating the whole talk
+    # (translate_srt.py exits non-zero when the diff does not line up).
+    # --force skips the diff and re-translates everything (e.g. after a prompt change).
+    if os.path.exists(target) and not force:
+        if not os.path.exists(snapshot):
+            return False, (
+                f"找不到 {os.path.relpath(snapshot, ROOT_DIR)}，無法只翻譯變動的字幕；"
+                f"未修改 {os.path.basename(target)}（要整檔重新翻譯請加 --force）"
+            )
+        with open(snapshot, "r", encoding="utf-8-sig") as f:
+            old_content = f.read()
+        with open(src, "r", encoding="utf-8-sig") as f:
+            new_content = f.read()
+        diff_path = os.path.join(SNAPSHOT_DIR, f"{talk.name}.diff.json")
+        with open(diff_path, "w", encoding="utf-8") as f:
+            json.dump({os.path.abspath(src): diff_files(old_content, new_content)}, f, ensure_ascii=False)
+        args.append(diff_path)
+
+    return _run_script(*args)
+
+
+def _fix_inputs(talk):
+    target = target_srt(talk)
+    if not target or not os.path.exists(target):
+        return None
+    return [("file", target), ("file", os.path.join(SCRIPT_DIR, "fix_srt_overlap.py"))]
+
+
+def _fix_run(talk, force):
+    return _run_script(os.path.join(SCRIPT_DIR, "fix_srt_overlap.py"), target_srt(talk))
+
+
+def _align_inputs(talk):
+    video = video_path(ROOT_DIR, talk.name)
+    src = source_srt(talk)
+    if not os.path.exists(video) or not src:
+        return None
+    target = target_srt(talk)
+    files = [video, src] + ([target] if os.path.exists(target) else [])
+    return [("file", p) for p in files] + [("file", os.path.join(SCRIPT_DIR, "align_srt.py"))]
+
+
+def _align_run(talk, force):
+    # The Japanese file comes first: offset / drift are estimated from it
+    files = [p for p in (source_srt(talk), target_srt(talk)) if os.path.exists(p)]
+    return _run_script(os.path.join(SCRIPT_DIR, "align_srt.py"), video_path(ROOT_DIR, talk.name), *files)
+
+
+def _validate_files(talk):
+    return [p for p in (source_srt(talk), target_srt(talk)) if p and os.path.exists(p)]
+
+
+def _validate_inputs(talk):
+    files = _validate_files(talk)
+    if not files:
+        return None
+    return [("file", p) for p in files] + [("file", os.path.join(SCRIPT_DIR, "check_srt_format.py"))]
+
+
+def _validate_run(talk, force):
+    ok, log = True, []
+    for path in _validate_files(talk):
+        file_ok, msg = check_srt_format(path)
+        ok = ok and file_ok
+        log.append(f"{'✅' if file_ok else '❌'} {os.path.basename(path)}: {msg}")
+    return ok, "\n".join(log)
+
+
+STAGES = [
+    Stage("download", [], _download_inputs, lambda t: [video_path(ROOT_DIR, t.name)], _download_run),
+    Stage("translate", [], _translate_inputs, lambda t: [target_srt(t)], _translate_run),
+    Stage("fix", ["translate"], _fix_inputs, lambda t: [], _fix_run),
+    Stage("align", ["download", "fix"], _align_inputs, lambda t: [], _align_run),
+    Stage("validate", ["align"], _validate_inputs, lambda t: [], _validate_run),
+]
+
+
+# === Manifest ===
+
+def fingerprint(inputs):
+    """Hash a stage's inputs (URLs, file contents, or only the cue text of an .srt)."""
+    h = hashlib.sha256()
+    for kind, value in inputs:
+        if kind == "srt-text":
+            h.update(f"{kind}:{os.path.relpath(value, ROOT_DIR)}\0".encode("utf-8"))
+            with open(value, "r", encoding="utf-8-sig") as f:
+                for cue in parse_cues(f.read()):
+                    h.update(cue.text.encode("utf-8") + b"\0")
+            continue
+        if kind != "file":
+            h.update(f"{kind}:{value}\0".encode("utf-8"))
+            continue
+        # Relative to the repo, so moving the checkout keeps the manifest valid
+        h.update(f"{kind}:{os.path.relpath(value, ROOT_DIR)}\0".encode("utf-8"))
+        if not os.path.exists(value):
+            h.update(b"<missing>")
+            continue
+        st = os.stat(value)
+        if st.st_size > HASH_CONTENT_LIMIT:
+            h.update(f"{st.st_size}:{st.st_mtime_ns}".encode("utf-8"))
+            continue
+        with open(value, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def load_manifest(talks):
+    manifest = {"talks": {}}
+    if os.path.exists(MANIFEST_FILE):
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    for talk in talks:
+        entry = manifest["talks"].setdefault(talk.name, {"stages": {}})
+        entry["url"] = talk.url
+    return manifest
+
+
+def save_manifest(manifest):
+    tmp = MANIFEST_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, MANIFEST_FILE)
+
+
+def is_fresh(record, inputs_hash, outputs):
+    return (
+        record is not None
+        and record.get("status") == "done"
+        and record.get("inputs") == inputs_hash
+        and all(p and os.path.exists(p) for p in outputs)
+    )
+
+
+# === Scheduler ===
+
+def run_pipeline(talks, manifest, jobs, limits, force=False, dry_run=False, touch=False, enabled=()):
+    """
+    Run all stale (talk, stage) tasks in a worker pool.
+
+    A task is dispatched once all its dependency stages for the same talk
+    have finished and its stage has a free slot. With touch=True, stale
+    tasks are recorded as done without running them (like `make -t`).
+    OPT_IN stages are skipped unless listed in enabled.
+    Returns the number of failed tasks.
+    """
+    stages = {s.name: s for s in STAGES}
+    # Stage-major order, so every talk's downloads / translations start early
+    pending = [(talk, stage) for stage in STAGES for talk in talks]
+    finished = {}   # (talk name, stage name) -> "done" / "fresh" / "skipped" / "failed" / "blocked"
+    running = {}    # future -> (talk, stage, started)
+    running_per_stage = {s.name: 0 for s in STAGES}
+    failed = 0
+
+    def record(talk, stage, status):
+        inputs = stage.inputs(talk)
+        manifest["talks"][talk.name]["stages"][stage.name] = {
+            "status": status,
+            "inputs": fingerprint(inputs) if inputs is not None else None,
+            "updated": datetime.now().isoformat(timespec="seconds"),
+        }
+        if stage.name == "translate" and status == "done":
+            _save_snapshot(talk)
+        save_manifest(manifest)
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while pending or running:
+            for talk, stage in list(pending):
+                dep_states = [finished.get((talk.name, d)) for d in stage.deps]
+                if None in dep_states:
+                    continue
+                if any(s in ("failed", "blocked") for s in dep_states):
+                    pending.remove((talk, stage))
+                    finished[(talk.name, stage.name)] = "blocked"
+                    print(f"⏭️  [{talk.name}] {stage.name}: 前一階段失敗，跳過")
+                    continue
+                if len(running) >= jobs:
+                    break
+                if running_per_stage[stage.name] >= limits.get(stage.name, jobs):
+                    continue
+
+                pending.remove((talk, stage))
+                inputs = stage.inputs(talk)
+                if inputs is None or (stage.name in OPT_IN and stage.name not in enabled):
+                    finished[(talk.name, stage.name)] = "skipped"
+                    continue
+
+                last = manifest["talks"][talk.name]["stages"].get(stage.name)
+                # In a dry run nothing actually changes, so treat "upstream would run" as stale
+                upstream_dirty = dry_run and "done" in dep_states
+                if not force and not upstream_dirty and is_fresh(last, fingerprint(inputs), stage.outputs(talk)):
+                    finished[(talk.name, stage.name)] = "fresh"
+                    continue
+
+                if not force and last is None and stage.name in ADOPT_EXISTING and all(
+                    p and os.path.exists(p) for p in stage.outputs(talk)
+                ):
+                    finished[(talk.name, stage.name)] = "fresh"
+                    if not dry_run:
+                        record(talk, stage, "done")
+                    print(f"📌 [{talk.name}] {stage.name}: 已有產出，記錄為最新")
+                    continue
+
+                if touch:
+                    finished[(talk.name, stage.name)] = "done"
+                    record(talk, stage, "done")
+                    print(f"👆 [{talk.name}] {stage.name}")
+                    continue
+
+                if dry_run:
+                    # Pretend it ran, so downstream stages show up as stale too
+                    finished[(talk.name, stage.name)] = "done"
+                    print(f"🔸 [{talk.name}] {stage.name}")
+                    continue
+
+                print(f"▶️  [{talk.name}] {stage.name}")
+                running_per_stage[stage.name] += 1
+                running[pool.submit(stage.run, talk, force)] = (talk, stage, time.time())
+
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                talk, stage, started = running.pop(future)
+                running_per_stage[stage.name] -= 1
+                try:
+                    ok, log = future.result()
+                except Exception as e:
+                    ok, log = False, str(e)
+
+                elapsed = time.time() - started
+                if ok:
+                    finished[(talk.name, stage.name)] = "done"
+                    record(talk, stage, "done")
+                    # align rewrites the .zh.srt that fix hashed; that is not a reason to fix it again
+                    fix_record = manifest["talks"][talk.name]["stages"].get("fix")
+                    if stage.name == "align" and fix_record and fix_record.get("status") == "done":
+                        record(talk, stages["fix"], "done")
+                    print(f"✅ [{talk.name}] {stage.name}（{elapsed:.1f}s）")
+                else:
+                    failed += 1
+                    finished[(talk.name, stage.name)] = "failed"
+                    record(talk, stage, "failed")
+                    print(f"❌ [{talk.name}] {stage.name}（{elapsed:.1f}s）")
+                    for line in log.splitlines()[-10:]:
+                        print(f"    {line}")
+
+    ran = sum(1 for s in finished.values() if s == "done")
+    fresh = sum(1 for s in finished.values() if s == "fresh")
+    verb = "需要執行" if dry_run else "已標記" if touch else "已執行"
+    print(f"\n🎯 {verb} {ran} 個階段，{fresh} 個已是最新，{failed} 個失敗")
+    return failed
+
+
+def print_status(talks, manifest):
+    for talk in talks:
+        stages = manifest["talks"].get(talk.name, {}).get("stages", {})
+        states = "  ".join(f"{s.name}:{stages.get(s.name, {}).get('status', '-')}" for s in STAGES)
+        print(f"{talk.name}\n    {states}")
+
+
+def parse_limits(values):
+    limits = dict(DEFAULT_LIMITS)
+    for value in values:
+        name, _, count = value.partition("=")
+        if name not in {s.name for s in STAGES} or not count.isdigit() or int(count) < 1:
+            raise SystemExit(f"❌ 無效的 --limit：{value}（格式：stage=N）")
+        limits[name] = int(count)
+    return limits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run stale pipeline stages for every talk.")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="worker pool size")
+    parser.add_argument("--limit", action="append", default=[], metavar="STAGE=N",
+                        help="max concurrent tasks for a stage (default: download=2, translate=2, align=2)")
+    parser.add_argument("--talk", action="append", default=[], help="only run these talks (folder name)")
+    parser.add_argument("--force", action="store_true", help="rerun stages even if up to date")
+    parser.add_argument("--dry-run", action="store_true", help="only list the stages that would run")
+    parser.add_argument("--touch", action="store_true",
+                        help="record stale stages as done without running them (e.g. for existing translations)")
+    parser.add_argument("--align", action="store_true",
+                        help="also run align_srt.py (rewrites subtitle timing; off by default)")
+    parser.add_argument("--status", action="store_true", help="print the manifest and exit")
+    args = parser.parse_args()
+
+    talks = load_talks()
+    if args.talk:
+        talks = [t for t in talks if t.name in args.talk]
+        if not talks:
+            print("❌ 找不到指定的場次。")
+            sys.exit(1)
+
+    manifest = load_manifest(talks)
+    if args.status:
+        print_status(talks, manifest)
+        return
+
+    failed = run_pipeline(
+        talks, manifest, max(args.jobs, 1), parse_limits(args.limit),
+        force=args.force, dry_run=args.dry_run, touch=args.touch,
+        enabled={"align"} if args.align else set(),
+    )
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+------------------------------------------------------------
+Script: srt_diff.py
+Purpose:
+    Compare two revisions of an .srt file cue by cue and classify
+    every cue as unchanged, retimed, retexted, inserted or deleted.
+    The result lets check_srt_format.py, translate_srt.py and
+    fix_srt_overlap.py work only on the cues that actually changed
+    (plus their neighbours) instead of re-processing whole files.
+
+Usage:
+    1️⃣ Diff two local files:
+        python script/srt_diff.py old.srt new.srt
+
+    2️⃣ Diff changed files against a git revision and write srt_diff.json:
+        python script/srt_diff.py --base <base_sha> [file.srt ...]
+       (without file arguments, the CHANGED_FILES env var is used)
+
+    Notes:
+        - Cues are matched by their text, so a pure retime (shift_srt.py)
+          is reported as "retimed" rather than delete + insert.
+        - Matching is patience-style: common leading/trailing cues are
+          skipped, then cues whose text is unique on both sides anchor the
+          match, so scattered small edits in large files stay cheap.
+          Stretches with no unique text at all (e.g. long runs of
+          "はい" / "ええ") go through SequenceMatcher while they are small
+          (MAX_MATCHER_CELLS); larger ones are paired by position, so the
+          whole diff stays near-linear at the cost of reporting more cues
+          as changed inside such a stretch.
+        - Files that do not exist in the base revision are not written to
+          srt_diff.json; the tools then fall back to processing them fully.
+------------------------------------------------------------
+"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import namedtuple
+from bisect import bisect_left
+from difflib import SequenceMatcher
+
+TIME_LINE = re.compile(r"^\s*(\d{2}:\d{2}:\d{2},\d{3})\s*-->\s*(\d{2}:\d{2}:\d{2},\d{3})\s*$")
+
+UNCHANGED = "unchanged"
+RETIMED = "retimed"
+RETEXTED = "retexted"
+INSERTED = "inserted"
+DELETED = "deleted"
+
+DIFF_FILE = "srt_diff.json"
+
+# start / end are the raw "HH:MM:SS,mmm" strings (None if the block has no valid timing line)
+Cue = namedtuple("Cue", ["start", "end", "text"])
+
+
+def parse_cues(content: str) -> list:
+    """
+    Split SRT content into cues.
+
+    Blocks are separated by blank lines, the same way check_srt_format.py
+    and fix_srt_overlap.py split them, so cue positions line up across tools.
+    Malformed blocks are kept (with start/end set to None) instead of dropped.
+    """
+    cues, block = [], []
+    for line in content.lstrip("\ufeff").splitlines() + [""]:
+        if line.strip() == "":
+            if block:
+                cues.append(_block_to_cue(block))
+                block = []
+        else:
+            block.append(line.rstrip())
+    return cues
+
+
+def _block_to_cue(block: list) -> Cue:
+    body = block[1:] if block[0].strip().isdigit() else block
+    m = TIME_LINE.match(body[0]) if body else None
+    if m:
+        return Cue(m.group(1), m.group(2), "\n".join(body[1:]).strip())
+    return Cue(None, None, "\n".join(body).strip())
+
+
+def diff_cues(old: list, new: list) -> list:
+    """
+    Classify cues between two parsed revisions.
+
+    Returns a list of (kind, old_index, new_index) tuples in file order.
+    Indices are 0-based; old_index is None for inserted cues and
+    new_index is None for deleted ones.
+    """
+    old_texts = [c.text for c in old]
+    new_texts = [c.text for c in new]
+    matches = []
+    _match(old_texts, new_texts, 0, len(old), 0, len(new), matches, 0)
+
+    ops = []
+    i = j = 0
+    for mi, mj in matches + [(len(old), len(new))]:
+        ops.extend(_gap_ops(old, new, i, mi, j, mj))
+        if mi < len(old):
+            ops.append((_same_text_kind(old[mi], new[mj]), mi, mj))
+        i, j = mi + 1, mj + 1
+    return ops
+
+
+# Below this depth, gaps without unique anchors fall back to SequenceMatcher
+MAX_ANCHOR_DEPTH = 32
+
+# SequenceMatcher is quadratic on repetitive texts; gaps larger than
+# len(old) * len(new) cells are paired by position instead (~0.1 s at the cap)
+MAX_MATCHER_CELLS = 1000 * 1000
+
+
+def _match(a, b, alo, ahi, blo, bhi, out, depth):
+    """
+    Append matching (i, j) pairs of equal texts in a[alo:ahi] / b[blo:bhi] to out, in order.
+
+    Patience-style: skip the common prefix / suffix, then anchor on texts
+    that occur exactly once on both sides and recurse into the gaps between
+    anchors. Only gaps without any unique text (e.g. runs of "はい") go
+    through SequenceMatcher, and only up to MAX_MATCHER_CELLS; larger ones
+    keep the cues that are equal at the same position. The cost follows
+    the size of the edits rather than the distance between them.
+    """
+    while alo < ahi and blo < bhi and a[alo] == b[blo]:
+        out.append((alo, blo))
+        alo += 1
+        blo += 1
+    suffix = []
+    while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+        ahi -= 1
+        bhi -= 1
+        suffix.append((ahi, bhi))
+
+    if alo < ahi and blo < bhi:
+        anchors = _unique_anchors(a, b, alo, ahi, blo, bhi) if depth < MAX_ANCHOR_DEPTH else []
+        if anchors:
+            i, j = alo, blo
+            for ai, bj in anchors:
+                _match(a, b, i, ai, j, bj, out, depth + 1)
+                out.append((ai, bj))
+                i, j = ai + 1, bj + 1
+            _match(a, b, i, ahi, j, bhi, out, depth + 1)
+        elif (ahi - alo) * (bhi - blo) <= MAX_MATCHER_CELLS:
+            matcher = SequenceMatcher(None, a[alo:ahi], b[blo:bhi], autojunk=False)
+            for block in matcher.get_matching_blocks():
+                for k in range(block.size):
+                    out.append((alo + block.a + k, blo + block.b + k))
+        else:
+            for k in range(min(ahi - alo, bhi - blo)):
+                if a[alo + k] == b[blo + k]:
+                    out.append((alo + k, blo + k))
+
+    out.extend(reversed(suffix))
+
+
+def _unique_anchors(a, b, alo, ahi, blo, bhi):
+    """Longest increasing run of (i, j) pairs whose text is unique in both ranges."""
+    counts = {}
+    for i in range(alo, ahi):
+        entry = counts.setdefault(a[i], [0, 0, i, 0])
+        entry[0] += 1
+    for j in range(blo, bhi):
+        entry = counts.get(b[j])
+        if entry is not None:
+            entry[1] += 1
+            entry[3] = j
+    pairs = sorted((i, j) for na, nb, i, j in counts.values() if na == 1 and nb == 1)
+    if not pairs:
+        return []
+
+    # Longest increasing subsequence on j (patience sorting)
+    tails, tail_idx, prev = [], [], [None] * len(pairs)
+    for k, (_, j) in enumerate(pairs):
+        pos = bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_idx.append(k)
+        else:
+            tails[pos] = j
+            tail_idx[pos] = k
+        prev[k] = tail_idx[pos - 1] if pos > 0 else None
+
+    result, k = [], tail_idx[-1]
+    while k is not None:
+        result.append(pairs[k])
+        k = prev[k]
+    return result[::-1]
+
+
+def _gap_ops(old, new, i1, i2, j1, j2):
+    """Ops for an unmatched stretch old[i1:i2] / new[j1:j2]: pair positionally, the rest are inserts/deletes."""
+    ops = []
+    paired = min(i2 - i1, j2 - j1)
+    for k in range(paired):
+        i, j = i1 + k, j1 + k
+        if (old[i].start, old[i].end) == (new[j].start, new[j].end):
+            ops.append((RETEXTED, i, j))
+        else:
+            ops.append((DELETED, i, None))
+            ops.append((INSERTED, None, j))
+    for i in range(i1 + paired, i2):
+        ops.append((DELETED, i, None))
+    for j in range(j1 + paired, j2):
+        ops.append((INSERTED, None, j))
+    return ops
+
+
+def _same_text_kind(old_cue: Cue, new_cue: Cue) -> str:
+    if (old_cue.start, old_cue.end) == (new_cue.start, new_cue.end):
+        return UNCHANGED
+    return RETIMED
+
+
+def changed_ranges(ops: list, new_count: int, context: int = 1) -> list:
+    """
+    Turn diff ops into merged, half-open [start, end) ranges of new cue indices.
+
+    Every non-unchanged cue is widened by `context` neighbours on each side.
+    A deleted cue marks the cues on both sides of the gap it left behind.
+    """
+    points = []
+    next_new = 0
+    for kind, _, j in ops:
+        if j is not None:
+            next_new = j + 1
+        if kind == UNCHANGED:
+            continue
+        if kind == DELETED:
+            points.append((next_new - 1, next_new))
+        else:
+            points.append((j, j))
+
+    ranges = []
+    for first, last in sorted(points):
+        start = max(first - context, 0)
+        end = min(last + context + 1, new_count)
+        if start >= end:
+            continue
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+    return ranges
+
+
+def load_diff(diff_path: str, srt_path: str):
+    """
+    Look up the diff entry for srt_path in a srt_diff.json file.
+
+    Returns a dict with "ops" and "ranges", or None if there is no entry
+    (callers should then process the whole file).
+    """
+    if not diff_path or not os.path.exists(diff_path):
+        return None
+    with open(diff_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data.get(os.path.abspath(srt_path))
+
+
+def read_revision(rev: str, path: str):
+    """Read a file's content at a git revision, or None if it did not exist there."""
+    folder, name = os.path.split(os.path.abspath(path))
+    result = subprocess.run(
+        ["git", "-C", folder, "show", f"{rev}:./{name}"],
+        capture_output=True,
+    )
+    if result.returncode != 0:
+        return None
+    return result.stdout.decode("utf-8-sig")
+
+
+def diff_files(old_content: str, new_content: str) -> dict:
+    """Diff two SRT contents and return a JSON-serialisable entry."""
+    old, new = parse_cues(old_content), parse_cues(new_content)
+    ops = diff_cues(old, new)
+    return {
+        "ops": [list(op) for op in ops],
+        "ranges": changed_ranges(ops, len(new)),
+    }
+
+
+def summarize(ops: list) -> str:
+    counts = {}
+    for kind, _, _ in ops:
+        counts[kind] = counts.get(kind, 0) + 1
+    order = [UNCHANGED, RETIMED, RETEXTED, INSERTED, DELETED]
+    return ", ".join(f"{kind} {counts[kind]}" for kind in order if kind in counts)
+
+
+def main():
+    args = sys.argv[1:]
+
+    # Case 1: two local files
+    if len(args) == 2 and args[0] != "--base":
+        with open(args[0], "r", encoding="utf-8-sig") as f:
+            old_content = f.read()
+        with open(args[1], "r", encoding="utf-8-sig") as f:
+            new_content = f.read()
+        entry = diff_files(old_content, new_content)
+        for kind, i, j in entry["ops"]:
+            if kind != UNCHANGED:
+                old_no = "-" if i is None else i + 1
+                new_no = "-" if j is None else j + 1
+                print(f"{kind:>9}  {old_no:>5} → {new_no}")
+        print(f"\n📊 {summarize(entry['ops'])}")
+        print(f"🎯 Affected cue ranges (1-based): {[[s + 1, e] for s, e in entry['ranges']]}")
+        return
+
+    # Case 2: changed files against a git revision
+    if len(args) < 2 or args[0] != "--base":
+        print("用法: python srt_diff.py <old.srt> <new.srt>")
+        print("      python srt_diff.py --base <rev> [file.srt ...]")
+        sys.exit(1)
+
+    base = args[1]
+    files = args[2:] or os.getenv("CHANGED_FILES", "").splitlines()
+    result = {}
+    for path in files:
+        if not path.lower().endswith(".srt") or not os.path.exists(path):
+            continue
+        old_content = read_revision(base, path)
+        if old_content is None:
+            print(f"🆕 {path}: not in {base}, will be processed fully")
+            continue
+        with open(path, "r", encoding="utf-8-sig") as f:
+            new_content = f.read()
+        entry = diff_files(old_content, new_content)
+        result[os.path.abspath(path)] = entry
+        print(f"🔍 {path}: {summarize(entry['ops'])}")
+
+    with open(DIFF_FILE, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False)
+    print(f"\n✅ Wrote {DIFF_FILE} ({len(result)} files)")
+
+
+if __name__ == "__main__":
+    main()
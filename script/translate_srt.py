@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 import sys
 import os
+import re
 import subprocess
 
 # === 自動安裝缺少的套件 ===
@@ -27,13 +28,14 @@ ensure_package("python-dotenv")
 import srt
 from openai import OpenAI
 from dotenv import load_dotenv
+from srt_diff import INSERTED, RETEXTED, load_diff
 
 # === 載入 .env ===
 load_dotenv()
 
 # === 檢查參數 ===
 if len(sys.argv) < 2:
-    print("用法：python translate_srt.py <input.srt>")
+    print("用法：python translate_srt.py <input.srt> [srt_diff.json]")
     sys.exit(1)
 
 input_path = sys.argv[1]
@@ -43,6 +45,10 @@ if not os.path.exists(input_path):
 
 # === 自動設定輸出路徑 ===
 base, ext = os.path.splitext(input_path)
+# xxx.jp.srt / xxx.ja.srt → xxx.zh.srt（與 repo 中既有的檔名一致）
+stem, lang = os.path.splitext(base)
+if lang.lower() in (".jp", ".ja"):
+    base = stem
 output_path = f"{base}.zh.srt"
 
 # === 初始化 OpenAI ===
@@ -56,61 +62,233 @@ client = OpenAI(api_key=api_key)
 with open(input_path, "r", encoding="utf-8") as f:
     subs = list(srt.parse(f.read()))
 
-# === 批次翻譯設定 ===
-batch_size = 100
+# === 只翻譯有變動的字幕（需要 srt_diff.py 產生的 diff 與既有的翻譯檔）===
+# 有指定 diff 卻無法套用時直接結束，不要改成整檔重新翻譯而覆蓋人工校正過的翻譯
+todo = subs
+if len(sys.argv) > 2 and os.path.exists(output_path):
+    diff = load_diff(sys.argv[2], input_path)
+    if not diff:
+        print(f"❌ {sys.argv[2]} 中沒有 {input_path} 的 diff，未修改 {output_path}")
+        sys.exit(1)
+    with open(output_path, "r", encoding="utf-8") as f:
+        old_translated = list(srt.parse(f.read()))
+    old_count = 1 + max((i for _, i, _ in diff["ops"] if i is not None), default=-1)
+    if len(old_translated) != old_count:
+        print(f"❌ 既有翻譯行數（{len(old_translated)}）與 diff 的原文行數（{old_count}）不符，無法逐行套用。")
+        print(f"   未修改 {output_path}；若要整檔重新翻譯，請不帶 diff 執行。")
+        sys.exit(1)
+    todo = []
+    for kind, i, j in diff["ops"]:
+        if j is None:
+            continue
+        if kind in (INSERTED, RETEXTED):
+            todo.append(subs[j])
+        else:
+            # 未變動或只改時間：沿用既有翻譯，時間軸以新的原文為準
+            subs[j].content = old_translated[i].content
+    print(f"🔍 依 diff 只需翻譯 {len(todo)} / {len(subs)} 行")
 
-for start in range(0, len(subs), batch_size):
-    end = min(start + batch_size, len(subs))
-    subs_batch = subs[start:end]
-    print(f"正在翻譯第 {start+1}～{end} 行...")
+# === 翻譯提示詞 ===
+# 固定的規則、術語表與範例全部放在 system 訊息，每個批次都送出完全相同的位元組，
+# 只有 user 訊息（字幕內容）會變動，這樣供應端的 prompt caching 才能命中前綴。
+# 注意：
+# - 不要在這裡放入檔名、批次編號等會變動的內容。
+# - OpenAI 只快取長度 ≥ 1024 tokens 的前綴，低於這個長度 cached_tokens 永遠是 0。
+#   下面的術語表與範例讓前綴超過這個門檻；刪減內容時請留意。
 
-    if all(not s.content.strip() for s in subs_batch):
-        continue
+# 保留原文、不翻譯的技術用語
+GLOSSARY_KEEP = [
+    "Swift", "SwiftUI", "UIKit", "AppKit", "UIView", "UIViewController", "API", "SDK",
+    "Xcode", "Xcode Previews", "Swift Package Manager", "Swift Build", "LLVM", "Clang",
+    "Apple", "iOS", "iPadOS", "macOS", "iPhone", "iPad", "WWDC", "iOSDC", "GitHub", "CI",
+    "FormatStyle", "Foundation", "Core Location", "URLSession", "BackgroundTasks",
+    "StoreKit", "Combine", "async/await", "actor", "Sendable", "Swift Concurrency",
+    "WebP", "GIF", "PNG", "JPEG", "QR", "NFC", "GPS",
+]
 
-    batch_text = "\n\n".join(
-        [f"{i+1}. {sub.content.strip()}" for i, sub in enumerate(subs_batch)]
-    )
+# 日文用語 → 固定的繁體中文（台灣）譯法，確保同一場與不同場次的用詞一致
+GLOSSARY_TRANSLATE = {
+    "カスタムUI": "自訂UI",
+    "アプリ": "App",
+    "ビルド": "建置",
+    "コンパイル": "編譯",
+    "デバッグ": "除錯",
+    "リリース": "發佈",
+    "実装": "實作",
+    "パフォーマンス": "效能",
+    "メモリ": "記憶體",
+    "スレッド": "執行緒",
+    "非同期": "非同步",
+    "並行処理": "並行處理",
+    "バックグラウンド": "背景",
+    "フォアグラウンド": "前景",
+    "アップロード": "上傳",
+    "ダウンロード": "下載",
+    "画面": "畫面",
+    "ユーザー": "使用者",
+    "エンジニア": "工程師",
+    "ライブラリ": "函式庫",
+    "フレームワーク": "框架",
+    "モジュール": "模組",
+    "パッケージ": "套件",
+    "プロジェクト": "專案",
+    "ソースコード": "原始碼",
+    "サーバー": "伺服器",
+    "クライアント": "用戶端",
+    "データベース": "資料庫",
+    "ログ": "日誌",
+    "ログ基盤": "日誌基礎架構",
+    "キャッシュ": "快取",
+    "画像": "圖片",
+    "アニメーション": "動畫",
+    "デコード": "解碼",
+    "エンコード": "編碼",
+    "フレーム": "影格",
+    "圧縮": "壓縮",
+    "ペイウォール": "付費牆",
+    "サブスクリプション": "訂閱",
+    "課金": "付費",
+    "マイナンバーカード": "個人編號卡（My Number Card）",
+    "測位": "定位",
+    "位置情報": "位置資訊",
+    "アルゴリズム": "演算法",
+    "漫画": "漫畫",
+    "スライド": "投影片",
+    "登壇": "上台分享",
+}
 
-    prompt = f"""你是一個專業的日中字幕翻譯者。
+SYSTEM_PROMPT = f"""你是一個專業的日中字幕翻譯者。
 
-以下是一段日本iOS開發研討會的逐字稿字幕（SRT格式）。
+使用者會提供一段日本iOS開發研討會的逐字稿字幕，每一行是一條字幕，格式為「編號. 台詞」。
 請將其中的日文台詞翻譯成自然、流暢的繁體中文。
 
 【重要規則】
-- 保留每一行的編號與時間軸格式（例如 “1”, “00:00:00,000 --> 00:00:05,000”）。
-- 只翻譯台詞內容，不要修改或刪除任何時間碼。
-- 不要新增或合併行數。
+- 每一行輸入輸出一行翻譯，格式同樣是「編號. 翻譯」，編號與輸入相同。
+- 不要輸出 SRT 的時間軸或單獨的編號行，只輸出「編號. 翻譯」。
+- 不要新增、刪除、合併或拆分行，也不要更動編號順序。
 - 不要加入任何說明、括號、標註或空行。
-- 技術用語（例如 Swift, UIKit, API, UIView, カスタムUI, Xcode, Apple）請保留原文。
+- 下方「保留原文」列表中的技術用語請保留原文。
+- 下方「固定譯法」列表中的日文用語請使用指定的中文譯法，不要自行改寫。
 - 若有日語語助詞或語氣詞（例如「ですね」「かな」「っていう」），請自然轉化為中文語氣。
+- 「えーと」「あのー」「まあ」等口頭禪可以省略或譯為「那個」「嗯」，不要逐字直譯。
+- 數字、版本號與程式碼（例如 iOS 18、Swift 6、`@MainActor`）保持原樣。
 - 請確保中文句子自然且口語化，但不失專業感。
-- 僅輸出完整的翻譯後 SRT 內容，不要多餘文字。
+- 僅輸出翻譯後的各行，不要多餘文字。
+
+【背景】
+- 內容來自 iOSDC Japan 2025 的演講，講者多為日本的 iOS 工程師，觀眾是台灣的開發者社群。
+- 演講主題涵蓋 Swift 與 SwiftUI、建置系統、圖片格式、背景處理、定位技術、付費牆設計、日誌基礎架構等。
+- 字幕是語音辨識後再人工校正的逐字稿，偶爾會有錯字或斷句不自然，請依上下文推測正確意思後翻譯。
+- 一句話常會被切成好幾條字幕；每一條只翻譯該條的內容，不要把後一條的內容提前翻到前一條。
+- 即使某一行只有「はい」「うん」之類的短句，也要輸出對應編號的一行。
 
-範例：
+【保留原文】
+{", ".join(GLOSSARY_KEEP)}
+
+【固定譯法】
+{chr(10).join(f"- {ja} → {zh}" for ja, zh in GLOSSARY_TRANSLATE.items())}
+
+範例一：
 原文：
-1
-00:00:00,000 --> 00:00:03,000
-カスタムUIを作るのは大変です。
+1. カスタムUIを作るのは大変です。
+2. えーと、まあ、今日はですね、バックグラウンドでのアップロード処理についてお話しします。
+3. Xcode Previewsが重くて、ビルドに5分くらいかかっていたんですよね。
+4. ペイウォールの設計次第で、課金率がかなり変わるっていう話です。
+5. はい。
+6. ご清聴ありがとうございました。
 
 輸出：
-1
-00:00:00,000 --> 00:00:03,000
-製作自訂UI是件很不容易的事。
+1. 製作自訂UI是件很不容易的事。
+2. 今天呢，我要來談談在背景執行上傳處理的部分。
+3. Xcode Previews 很慢，建置大概要花上 5 分鐘。
+4. 也就是說，付費牆怎麼設計，會大幅影響付費率。
+5. 好。
+6. 感謝各位的聆聽。
+
+範例二：
+原文：
+1. 列車の位置を推定するアルゴリズムを、GPSが使えない地下の区間でも動くように工夫しました。
+2. マイナンバーカードをiPhoneに入れられるようになったのは、本当に大きな一歩だと思っています。
+3. GIFアニメをたくさん表示すると、
+4. メモリの使用量が一気に跳ね上がってしまうんですね。
+5. なので、フレームごとにデコードするのではなく、
+6. 必要なフレームだけをキャッシュするようにしました。
+7. Swift 6ではSendableのチェックが厳しくなったので、
+8. 既存のコードをかなり書き直すことになりました。
+9. うん。
+10. 質問がある方は、このあとAsk the Speakerのコーナーでお待ちしています。
 
-以下是要翻譯的內容：
+輸出：
+1. 我們下了點工夫，讓推估列車位置的演算法在無法使用 GPS 的地下路段也能運作。
+2. 個人編號卡（My Number Card）能放進 iPhone，我認為真的是很大的一步。
+3. 一次顯示大量 GIF 動畫的話，
+4. 記憶體用量就會一口氣暴增。
+5. 所以我們不是每個影格都解碼，
+6. 而是只快取需要的影格。
+7. Swift 6 對 Sendable 的檢查變得更嚴格，
+8. 所以既有的程式碼得大幅改寫。
+9. 嗯。
+10. 有問題的朋友，歡迎稍後到 Ask the Speaker 區找我。
 """
 
+# 讓相同前綴的請求盡量送到同一台快取伺服器
+PROMPT_CACHE_KEY = "iosdc2025translate-srt"
+
+# 回應的每一行：「編號. 翻譯」（也接受全形句點與頓號）
+NUMBERED_LINE = re.compile(r"^\s*(\d+)\s*[.．、]\s*(.*)$")
+
+# === 批次翻譯設定 ===
+batch_size = 100
+total_prompt_tokens = 0
+total_cached_tokens = 0
+api_batches = 0
+
+for start in range(0, len(todo), batch_size):
+    end = min(start + batch_size, len(todo))
+    subs_batch = todo[start:end]
+    print(f"正在翻譯第 {start+1}～{end} 行...")
+
+    if all(not s.content.strip() for s in subs_batch):
+        continue
+
+    # 每條字幕一行「編號. 台詞」；多行字幕先併成一行，回應才能依編號對回去
+    batch_text = "\n".join(
+        [f"{i+1}. {' '.join(sub.content.split())}" for i, sub in enumerate(subs_batch)]
+    )
+
     try:
         response = client.chat.completions.create(
             model="gpt-5",
-            messages=[{"role": "user", "content": prompt + "\n\n" + batch_text}],
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": batch_text},
+            ],
+            extra_body={"prompt_cache_key": PROMPT_CACHE_KEY},
         )
+
+        # 回報快取命中的 token 數，方便確認省下多少輸入成本
+        usage = getattr(response, "usage", None)
+        details = getattr(usage, "prompt_tokens_details", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        cached_tokens = getattr(details, "cached_tokens", 0) or 0
+        total_prompt_tokens += prompt_tokens
+        total_cached_tokens += cached_tokens
+        api_batches += 1
+        print(f"   🧮 輸入 {prompt_tokens} tokens，其中快取命中 {cached_tokens}")
+
+        # 依「編號. 翻譯」對回字幕並去掉編號；沒有編號的行（說明文字、時間軸）不寫入字幕
         translated_text = response.choices[0].message.content.strip()
-        translated_lines = [
-            line.strip() for line in translated_text.splitlines() if line.strip()
-        ]
-        for sub, line in zip(subs_batch, translated_lines):
-            sub.content = line
+        translated = {}
+        for line in translated_text.splitlines():
+            m = NUMBERED_LINE.match(line)
+            if m and 1 <= int(m.group(1)) <= len(subs_batch) and m.group(2).strip():
+                translated[int(m.group(1))] = m.group(2).strip()
+        for i, sub in enumerate(subs_batch, start=1):
+            if i in translated:
+                sub.content = translated[i]
+        missing = len(subs_batch) - len(translated)
+        if missing:
+            print(f"   ⚠️ 有 {missing} 行沒有對應編號的翻譯，保留原文")
     except Exception as e:
         print(f"⚠️ 第 {start+1}～{end} 行翻譯失敗：{e}")
         continue
@@ -119,4 +297,10 @@ for start in range(0, len(subs), batch_size):
 with open(output_path, "w", encoding="utf-8") as f:
     f.write(srt.compose(subs))
 
+if total_prompt_tokens:
+    ratio = total_cached_tokens / total_prompt_tokens * 100
+    print(f"\n🧮 輸入 tokens 合計 {total_prompt_tokens}，快取命中 {total_cached_tokens}（{ratio:.1f}%）")
+    if total_cached_tokens == 0 and api_batches > 1:
+        print("ℹ️ 沒有任何快取命中：第一個批次一定不會命中；若之後的批次也是 0，請確認 SYSTEM_PROMPT 是否仍超過 1024 tokens。")
+
 print(f"\n✅ 翻譯完成！輸出檔案：{output_path}")